@@ -20,6 +20,10 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = r"C:\Users\ASUS\Downloads\dotted-
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")  
+# When false, contracts with complete data are rendered from a template instead of Gemini.
+USE_LLM = os.getenv("USE_LLM", "true").lower() in ("1", "true", "yes")
+# Encrypts the per-owner signing keys stored in OwnerKey. Unset means they are stored unencrypted.
+SIGNING_KEY_PASSPHRASE = os.getenv("SIGNING_KEY_PASSPHRASE")
 print("GEMINI_API_KEY:", GEMINI_API_KEY)
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -94,6 +98,29 @@ DATABASES = {
 }
 
 
+# Cache backing the contract API response cache. Use Redis when REDIS_URL is set so
+# every web worker and the contract consumer share the same invalidation version.
+# Without it each process has its own LocMemCache: invalidations made by the
+# consumer (run_contract_consumer) don't reach the web workers, and new contracts
+# can take up to the 30s page timeout to show up in cached lists.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+        }
+    }
+    # Treat a Redis outage as a cache miss instead of failing the request.
+    DJANGO_REDIS_IGNORE_EXCEPTIONS = True
+    DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
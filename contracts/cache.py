@@ -0,0 +1,25 @@
+from django.core.cache import cache
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTRACT_CACHE_TIMEOUT = 30
+CONTRACT_CACHE_VERSION_KEY = 'contracts:cache_version'
+
+# The response cache is best-effort: a cache outage must never fail a read or a write.
+
+def contract_cache_version():
+    """ Current cache version, or None if the cache is unavailable. """
+    try:
+        return cache.get_or_set(CONTRACT_CACHE_VERSION_KEY, time.time_ns(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Contract cache unavailable, serving uncached: {e}")
+        return None
+
+def invalidate_contract_cache():
+    """ Move cached contract responses to a new key prefix so stale pages are never served. """
+    try:
+        cache.set(CONTRACT_CACHE_VERSION_KEY, time.time_ns(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Failed to invalidate contract cache: {e}")
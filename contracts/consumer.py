@@ -0,0 +1,310 @@
+import os
+import asyncio
+import logging
+import orjson
+import aio_pika
+import httpx
+from django.db import OperationalError, close_old_connections, transaction
+from google.api_core import exceptions as google_exceptions
+from cachetools import LRUCache, TTLCache
+
+from .models import Contract
+from .gemini_helper import get_gemini
+from .cache import invalidate_contract_cache
+
+# ----------- Logging -----------
+logger = logging.getLogger("rabbitmq_consumer")
+logger.setLevel(logging.DEBUG)
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
+console_handler.setFormatter(formatter)
+logger.addHandler(console_handler)
+
+# ----------- RabbitMQ Setup -----------
+
+async def get_rabbitmq_channel():
+    try:
+        connection = await aio_pika.connect_robust(
+            host=os.environ.get('RABBITMQ_HOST', 'host.docker.internal'),
+            port=int(os.environ.get('RABBITMQ_PORT', 5672)),
+            heartbeat=int(os.environ.get('RABBITMQ_HEARTBEAT', 600)),
+        )
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=10)
+
+        # Rejected messages are routed to 'generate_contract.dead' instead of blocking the queue.
+        dlx = await channel.declare_exchange('generate_contract.dlx', aio_pika.ExchangeType.FANOUT, durable=True)
+        dead_queue = await channel.declare_queue('generate_contract.dead', durable=True)
+        await dead_queue.bind(dlx)
+
+        queue = await channel.declare_queue(
+            'generate_contract',
+            durable=True,
+            arguments={"x-dead-letter-exchange": 'generate_contract.dlx'},
+        )
+        logger.info("Connected to RabbitMQ and declared queue 'generate_contract'")
+        return connection, channel, queue
+    except Exception as e:
+        logger.error(f"Failed to connect to RabbitMQ: {e}")
+        raise
+
+# ----------- External API Calls -----------
+
+# One pooled async client for the consumer's lifetime so connections to the
+# profile and equipment services are kept alive between messages.
+# HTTP/2 is negotiated over TLS; plain http:// upstreams stay on keep-alive HTTP/1.1.
+_http = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    ),
+    timeout=httpx.Timeout(5.0, connect=2.0),
+)
+
+# Profiles rarely change, equipment (price, state) more often: keep the latter short-lived.
+PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', 300))
+EQUIPMENT_CACHE_TTL = int(os.environ.get('EQUIPMENT_CACHE_TTL', 60))
+
+# Only touched from the consumer's event loop, so no locking is needed.
+_profile_cache = TTLCache(maxsize=1024, ttl=PROFILE_CACHE_TTL)
+_equipment_cache = TTLCache(maxsize=1024, ttl=EQUIPMENT_CACHE_TTL)
+
+# Last (ETag, body) per URL. Outlives the TTL caches so an expired entry is
+# revalidated with If-None-Match instead of downloaded again.
+_etag_cache = LRUCache(maxsize=2048)
+
+class UpstreamUnavailable(Exception):
+    """ The profile or equipment service answered with a 5xx: worth retrying the message. """
+
+async def _get_json(url):
+    headers = {}
+    validator = _etag_cache.get(url)
+    if validator is not None:
+        headers["If-None-Match"] = validator[0]
+
+    response = await _http.get(url, headers=headers)
+    if response.status_code == 304 and validator is not None:
+        return validator[1]
+    if response.status_code >= 500:
+        raise UpstreamUnavailable(f"{url} returned {response.status_code}")
+    response.raise_for_status()
+
+    body = orjson.loads(response.content)
+    etag = response.headers.get("ETag")
+    if etag:
+        _etag_cache[url] = (etag, body)
+    return body
+
+async def fetch_profile(user):
+    cached = _profile_cache.get(user)
+    if cached is not None:
+        return cached
+    try:
+        url = f"http://host.docker.internal:8008/profile/profil/?user={user}"
+        profile = await _get_json(url)
+    except (httpx.TransportError, UpstreamUnavailable) as e:
+        # Outages propagate so the message is retried instead of producing an empty contract.
+        logger.error(f"Profile service unavailable for user {user}: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"Failed to fetch profile for user {user}: {e}")
+        return None
+    _profile_cache[user] = profile
+    return profile
+
+async def fetch_equipment(equipment_id):
+    cached = _equipment_cache.get(equipment_id)
+    if cached is not None:
+        return cached
+    try:
+        url = f"http://host.docker.internal:8006/api/stuffs/{equipment_id}/"
+        equipment = await _get_json(url)
+    except (httpx.TransportError, UpstreamUnavailable) as e:
+        logger.error(f"Equipment service unavailable for ID {equipment_id}: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"Failed to fetch equipment ID {equipment_id}: {e}")
+        return None
+    _equipment_cache[equipment_id] = equipment
+    return equipment
+
+# ----------- RabbitMQ Consumer -----------
+
+async def process_message(data):
+    owner_name = data.get("rental")
+    client_name = data.get("client")
+    equipment_id = data.get("equipment")
+
+    equipment_ids = equipment_id if isinstance(equipment_id, list) else [equipment_id]
+    profile_info_client, profile_info_owner, *equipment_info = await asyncio.gather(
+        fetch_profile(client_name),
+        fetch_profile(owner_name),
+        *(fetch_equipment(eid) for eid in equipment_ids),
+    )
+    if not isinstance(equipment_id, list):
+        equipment_info = equipment_info[0]
+
+    contract_data = {
+        "owner_name": owner_name,
+        "client_name": client_name,
+        "equipment": equipment_id,
+        "start_date": data.get("start_date"),
+        "end_date": data.get("end_date"),
+        "total_value": data.get("total_price"),
+        "details": data.get("status", ""),
+    }
+
+    # Gemini and the ORM are blocking: keep them off the event loop.
+    return await asyncio.to_thread(
+        lambda: get_gemini().build_draft_contract(
+            contract_data,
+            profile_owner=profile_info_owner,
+            profile_client=profile_info_client,
+            equipment_info=equipment_info,
+        )
+    )
+
+MAX_RETRIES = int(os.environ.get('RABBITMQ_MAX_RETRIES', 5))
+
+# Failures worth retrying; anything else (bad payload, invalid data) is dead-lettered at once.
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    OperationalError,
+    httpx.TransportError,
+    UpstreamUnavailable,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
+async def retry_or_reject(channel, message, error):
+    """
+    Republish a message that failed for a transient reason (up to MAX_RETRIES times),
+    otherwise reject it without requeueing so it goes to the dead-letter queue.
+    """
+    retries = int((message.headers or {}).get("x-retry-count", 0))
+    if isinstance(error, TRANSIENT_ERRORS) and retries < MAX_RETRIES:
+        await asyncio.sleep(2 ** retries)
+        await channel.default_exchange.publish(
+            aio_pika.Message(
+                body=message.body,
+                headers={**(message.headers or {}), "x-retry-count": retries + 1},
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key='generate_contract',
+        )
+        await message.ack()
+        logger.warning(f"Message requeued for retry {retries + 1}/{MAX_RETRIES}")
+    else:
+        await message.reject(requeue=False)
+        logger.warning("Message rejected and dead-lettered")
+
+class ContractBatcher:
+    """
+    Collect unsaved contracts with their messages and insert them with a
+    single bulk_create once `max_size` is reached or `max_wait` seconds elapse.
+    """
+
+    def __init__(self, channel, max_size=10, max_wait=2.0):
+        self.channel = channel
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._items = []
+        self._timer = None
+
+    async def add(self, contract, message):
+        self._items.append((contract, message))
+        if len(self._items) >= self.max_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        await self.flush()
+
+    async def flush(self):
+        items, self._items = self._items, []
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        if not items:
+            return
+
+        try:
+            await asyncio.to_thread(self._save, [contract for contract, _ in items])
+        except Exception as e:
+            logger.error(f"Failed to save batch of {len(items)} contracts: {e}", exc_info=True)
+            # Save one by one so a single bad contract does not fail the whole batch.
+            for contract, message in items:
+                try:
+                    await asyncio.to_thread(self._save_one, contract)
+                except Exception as error:
+                    logger.error(f"Failed to save contract for {contract.owner_name}: {error}", exc_info=True)
+                    await retry_or_reject(self.channel, message, error)
+                else:
+                    logger.info(f"Contract created with ID: {contract.id}")
+                    await message.ack()
+        else:
+            logger.info(f"Contracts created with IDs: {[contract.id for contract, _ in items]}")
+            for _, message in items:
+                await message.ack()
+
+        # Best-effort: never turns an already committed batch into a failure.
+        await asyncio.to_thread(invalidate_contract_cache)
+
+    @staticmethod
+    def _save(contracts):
+        try:
+            with transaction.atomic():
+                Contract.objects.bulk_create(contracts)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _save_one(contract):
+        try:
+            # bulk_create assigns pks; if the row was committed, don't insert it twice.
+            if contract.pk is not None:
+                if Contract.objects.filter(pk=contract.pk).exists():
+                    return
+                contract.pk = None
+            contract.save()
+        finally:
+            close_old_connections()
+
+async def consume():
+    connection, channel, queue = await get_rabbitmq_channel()
+    batcher = ContractBatcher(channel)
+
+    async def on_message(message):
+        try:
+            data = orjson.loads(message.body)
+            logger.info(f"Received message: {data}")
+
+            await batcher.add(await process_message(data), message)
+        except Exception as e:
+            logger.error(f"Error processing message: {e}", exc_info=True)
+            await retry_or_reject(channel, message, e)
+
+    try:
+        await queue.consume(on_message)
+        logger.info("Waiting for messages on 'generate_contract'. To exit press CTRL+C")
+        await asyncio.Future()
+    finally:
+        await batcher.flush()
+        await _http.aclose()
+        await connection.close()
+        logger.info("RabbitMQ connection closed.")
+
+def rabbitmq_consumer():
+    try:
+        asyncio.run(consume())
+    except Exception as e:
+        logger.error(f"Fatal error in RabbitMQ consumer: {e}", exc_info=True)
+        raise
@@ -1,64 +1,132 @@
 from typing import Dict, Any, Optional
 from django.conf import settings
-import google.generativeai as genai
+from cachetools import TTLCache
+from jinja2 import Environment, PackageLoader, select_autoescape
 from .models import Contract
-import json
+from collections import defaultdict
+from string import Template
+import functools
+import hashlib
+import threading
+
+# google.generativeai is imported and configured on first use, so processes that
+# never generate a contract (migrations, web workers, tests) don't pay for it.
+_genai = None
+_genai_lock = threading.Lock()
+
+def _load_genai():
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            _genai = genai
+    return _genai
+
+# Generated HTML keyed by a hash of the prompt: identical inputs skip the Gemini round-trip.
+_html_cache = TTLCache(maxsize=512, ttl=3600)
+_html_cache_lock = threading.Lock()
+
+_PROFILE_FIELDS = ("first_name", "last_name", "phone")
+_ADDRESS_FIELDS = ("street", "city", "state", "postal_code", "country")
+
+_PROMPT_TMPL = Template("""
+Generate a professional HTML equipment rental contract based on the following data:
+
+📄 Contract Details:
+- Owner Name: $contract_owner_name
+- Client Name: $contract_client_name
+- Start Date: $contract_start_date
+- End Date: $contract_end_date
+- Total Value: $contract_total_value TND
+
+👤 Owner Profile:
+- Full Name: $owner_first_name $owner_last_name
+- Phone: $owner_phone
+- Address: $owner_street, $owner_city, $owner_state, $owner_postal_code, $owner_country
+
+👤 Client Profile:
+- Full Name: $client_first_name $client_last_name
+- Phone: $client_phone
+- Address: $client_street, $client_city, $client_state, $client_postal_code, $client_country
+
+$equipment_section
+Please return a well-structured HTML contract that includes the parties' names, equipment details, rental terms, and a signature section for both the owner and the client.
+""")
+
+# One block per rented item; a single item gives the same text as before lists were supported.
+_EQUIPMENT_TMPL = Template("""🛠️ Equipment Information:
+- Name: $stuffname
+- Brand: $brand
+- Location: $location
+- Price per day: $price_per_day TND
+- Condition: $state
+- Rental Location: $rental_location
+- Description: $short_description
+
+📄 Detailed Description:
+$detailed_description
+""")
+
+# Static contract layout used instead of Gemini when settings.USE_LLM is off.
+_jinja_env = Environment(
+    loader=PackageLoader("contracts", "jinja2"),
+    autoescape=select_autoescape(["html"]),
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+_CONTRACT_TEMPLATE = _jinja_env.get_template("contracts/contract.html")
 
-# Configure Gemini API
-genai.configure(api_key=settings.GEMINI_API_KEY)
+_REQUIRED_CONTRACT_FIELDS = ("owner_name", "client_name", "start_date", "end_date", "total_value")
 
 class GeminiHelper:
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+    @functools.cached_property
+    def model(self):
+        return _load_genai().GenerativeModel('gemini-2.0-flash')
 
     def _sanitize_profile(self, profile: Any) -> Dict[str, Any]:
-        """ Ensure profile is a dict and not a list """
+        """ Flatten a profile (dict or single-item list) into the fields used by the prompt """
         if isinstance(profile, list):
-            return profile[0] if profile else {}
-        return profile or {}
+            profile = profile[0] if profile else {}
+        profile = profile or {}
+        address = profile.get("address") or {}
+
+        flat = {key: profile.get(key, "") for key in _PROFILE_FIELDS}
+        flat.update((key, address.get(key, "")) for key in _ADDRESS_FIELDS)
+        return flat
 
-    def _build_prompt(self, contract_data, profile_owner, profile_client, equipment_info) -> str:
+    def _build_prompt(self, contract_data, owner, client, equipment_info) -> str:
         """
-        Build a readable prompt from the provided dictionaries for Gemini.
+        Build a readable prompt for Gemini from the contract data and sanitized profiles.
         """
-        profile_owner = self._sanitize_profile(profile_owner)
-        profile_client = self._sanitize_profile(profile_client)
-
-        prompt = f"""
-Generate a professional HTML equipment rental contract based on the following data:
+        # Missing keys render as "" instead of raising in substitute().
+        mapping = defaultdict(str)
+        for prefix, profile in (("owner_", owner), ("client_", client)):
+            for key, value in profile.items():
+                mapping[prefix + key] = value
+        equipment = equipment_info if isinstance(equipment_info, list) else [equipment_info]
+        mapping["equipment_section"] = "\n".join(
+            _EQUIPMENT_TMPL.substitute(defaultdict(str, item or {})) for item in equipment
+        )
+        for key in ("owner_name", "client_name", "start_date", "end_date", "total_value"):
+            mapping["contract_" + key] = contract_data.get(key)
 
-📄 Contract Details:
-- Owner Name: {contract_data.get("owner_name")}
-- Client Name: {contract_data.get("client_name")}
-- Start Date: {contract_data.get("start_date")}
-- End Date: {contract_data.get("end_date")}
-- Total Value: {contract_data.get("total_value")} TND
+        return _PROMPT_TMPL.substitute(mapping)
 
-👤 Owner Profile:
-- Full Name: {profile_owner.get("first_name", "")} {profile_owner.get("last_name", "")}
-- Phone: {profile_owner.get("phone", "")}
-- Address: {profile_owner.get("address", {}).get("street", "")}, {profile_owner.get("address", {}).get("city", "")}, {profile_owner.get("address", {}).get("state", "")}, {profile_owner.get("address", {}).get("postal_code", "")}, {profile_owner.get("address", {}).get("country", "")}
-
-👤 Client Profile:
-- Full Name: {profile_client.get("first_name", "")} {profile_client.get("last_name", "")}
-- Phone: {profile_client.get("phone", "")}
-- Address: {profile_client.get("address", {}).get("street", "")}, {profile_client.get("address", {}).get("city", "")}, {profile_client.get("address", {}).get("state", "")}, {profile_client.get("address", {}).get("postal_code", "")}, {profile_client.get("address", {}).get("country", "")}
-
-🛠️ Equipment Information:
-- Name: {equipment_info.get("stuffname", "")}
-- Brand: {equipment_info.get("brand", "")}
-- Location: {equipment_info.get("location", "")}
-- Price per day: {equipment_info.get("price_per_day", "")} TND
-- Condition: {equipment_info.get("state", "")}
-- Rental Location: {equipment_info.get("rental_location", "")}
-- Description: {equipment_info.get("short_description", "")}
+    def _render_template(self, contract_data, owner, client, equipment_info) -> Optional[str]:
+        """
+        Render the contract from the static template, or return None if a field it needs is missing.
+        """
+        equipment = equipment_info if isinstance(equipment_info, list) else [equipment_info]
 
-📄 Detailed Description:
-{equipment_info.get("detailed_description", "")}
+        if not all(contract_data.get(key) for key in _REQUIRED_CONTRACT_FIELDS):
+            return None
+        if not (owner["first_name"] and client["first_name"]):
+            return None
+        if not all(isinstance(item, dict) and item.get("stuffname") for item in equipment):
+            return None
 
-Please return a well-structured HTML contract that includes the parties' names, equipment details, rental terms, and a signature section for both the owner and the client.
-"""
-        return prompt
+        return _CONTRACT_TEMPLATE.render(contract=contract_data, owner=owner, client=client, equipment=equipment)
 
     def generate_contract_html(
         self,
@@ -70,7 +138,22 @@ Please return a well-structured HTML contract that includes the parties' names,
         """
         Pass raw data to Gemini model to generate the contract HTML.
         """
-        prompt_text = self._build_prompt(contract_data, profile_owner, profile_client, equipment_info)
+        # Sanitize each profile once and share the result between the template and the prompt.
+        owner = self._sanitize_profile(profile_owner)
+        client = self._sanitize_profile(profile_client)
+
+        if not settings.USE_LLM:
+            html = self._render_template(contract_data, owner, client, equipment_info)
+            if html is not None:
+                return html
+
+        prompt_text = self._build_prompt(contract_data, owner, client, equipment_info)
+
+        key = hashlib.blake2b(prompt_text.encode(), digest_size=16).hexdigest()
+        with _html_cache_lock:
+            cached = _html_cache.get(key)
+        if cached is not None:
+            return cached
 
         # Gemini expects { "parts": [ { "text": "..."} ] }
         response = self.model.generate_content({
@@ -79,19 +162,25 @@ Please return a well-structured HTML contract that includes the parties' names,
             ]
         })
 
-        return response.text  # Assuming Gemini returns the contract HTML here
+        html = response.text  # Assuming Gemini returns the contract HTML here
+        with _html_cache_lock:
+            _html_cache[key] = html
+        return html
 
-    def create_draft_contract(
+    def build_draft_contract(
         self,
         contract_data: dict,
         profile_owner: Optional[Dict[str, Any]] = None,
         profile_client: Optional[Dict[str, Any]] = None,
         equipment_info: Optional[Any] = None,
     ) -> Contract:
+        """
+        Generate the contract HTML and return an unsaved Contract, so callers can batch inserts.
+        """
         # Ask Gemini to generate the HTML from raw data
         contract_html = self.generate_contract_html(contract_data, profile_owner, profile_client, equipment_info)
 
-        contract = Contract.objects.create(
+        return Contract(
             owner_name=contract_data["owner_name"],
             client_name=contract_data["client_name"],
             equipment=contract_data["equipment"],
@@ -101,4 +190,20 @@ Please return a well-structured HTML contract that includes the parties' names,
             start_date=contract_data.get("start_date"),
             end_date=contract_data.get("end_date")
         )
+
+    def create_draft_contract(
+        self,
+        contract_data: dict,
+        profile_owner: Optional[Dict[str, Any]] = None,
+        profile_client: Optional[Dict[str, Any]] = None,
+        equipment_info: Optional[Any] = None,
+    ) -> Contract:
+        contract = self.build_draft_contract(contract_data, profile_owner, profile_client, equipment_info)
+        contract.save()
         return contract
+
+
+@functools.lru_cache(maxsize=None)
+def get_gemini() -> GeminiHelper:
+    """ Shared instance so the model handle (and its client/auth state) is built once per process. """
+    return GeminiHelper()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from contracts.consumer import rabbitmq_consumer
+
+
+class Command(BaseCommand):
+    help = "Consume 'generate_contract' messages from RabbitMQ and create draft contracts."
+
+    def handle(self, *args, **options):
+        try:
+            rabbitmq_consumer()
+        except KeyboardInterrupt:
+            pass
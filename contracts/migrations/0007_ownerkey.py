@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-15 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0006_contract_equipment_alter_contract_contract_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_name', models.CharField(max_length=255, unique=True)),
+                ('private_key', models.TextField()),
+                ('public_key', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
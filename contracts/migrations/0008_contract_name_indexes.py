@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-15 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0007_ownerkey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['owner_name'], name='contract_owner_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['client_name'], name='contract_client_name_idx'),
+        ),
+    ]
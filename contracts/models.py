@@ -19,5 +19,27 @@ class Contract(models.Model):
     signed_date = models.DateField(null=True, blank=True)
     contract_text = models.TextField(null=True, blank=True)  # ✅ Removed max_length
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner_name'], name='contract_owner_name_idx'),
+            models.Index(fields=['client_name'], name='contract_client_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"Contract between {self.owner_name} & {self.client_name} ({self.status})"
+
+class OwnerKey(models.Model):
+    """
+    RSA key pair generated once per owner and reused for every signature.
+
+    private_key is encrypted (PKCS#8, scrypt + AES-128) with settings.SIGNING_KEY_PASSPHRASE
+    when it was set at generation time. Without it the key is stored as plaintext PEM and
+    anyone with database read access can sign as the owner.
+    """
+    owner_name = models.CharField(max_length=255, unique=True)
+    private_key = models.TextField()
+    public_key = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        return f"Contract between {self.owner_name} & {self.client_name} ({self.status})"
\ No newline at end of file
+        return f"Signing key for {self.owner_name}"
@@ -15,3 +15,9 @@ class ContractSerializer(serializers.ModelSerializer):
             'signed_date',
             'contract_text',
         ]
+
+
+class ContractListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Contract
+        fields = [f for f in ContractSerializer.Meta.fields if f != 'contract_text']
@@ -1,3 +1,175 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError
+from django.test import TransactionTestCase
+
+from . import cache as contract_cache
+from .consumer import MAX_RETRIES, ContractBatcher, retry_or_reject
+from .models import Contract
+
+
+class StubMessage:
+    """ Records what the consumer did with an aio-pika incoming message. """
+
+    def __init__(self, headers=None):
+        self.body = b'{}'
+        self.headers = headers or {}
+        self.content_type = 'application/json'
+        self.acked = False
+        self.rejected = False
+
+    async def ack(self):
+        self.acked = True
+
+    async def reject(self, requeue=False):
+        self.rejected = True
+        self.requeued = requeue
+
+
+class StubExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((message, routing_key))
+
+
+class StubChannel:
+    def __init__(self):
+        self.default_exchange = StubExchange()
+
+
+def make_contract(**kwargs):
+    data = {
+        "owner_name": "owner",
+        "client_name": "client",
+        "start_date": "2025-01-01",
+        "end_date": "2025-01-05",
+        "total_value": 100,
+        "contract_text": "<p>contract</p>",
+    }
+    data.update(kwargs)
+    return Contract(**data)
+
+
+def broken_cache():
+    return mock.patch.object(contract_cache.cache, "set", side_effect=ConnectionError("cache down"))
+
+
+# TransactionTestCase: the batcher saves from worker threads (asyncio.to_thread),
+# which use their own database connections.
+class ContractBatcherTests(TransactionTestCase):
+
+    def flush(self, items):
+        batcher = ContractBatcher(StubChannel())
+
+        async def run():
+            for contract, message in items:
+                await batcher.add(contract, message)
+            await batcher.flush()
+
+        asyncio.run(run())
+
+    def test_flush_saves_batch_and_acks(self):
+        messages = [StubMessage(), StubMessage()]
+        self.flush([(make_contract(), message) for message in messages])
+
+        self.assertEqual(Contract.objects.count(), 2)
+        self.assertTrue(all(message.acked for message in messages))
+
+    def test_cache_failure_does_not_dead_letter_saved_batch(self):
+        messages = [StubMessage(), StubMessage()]
+        with broken_cache():
+            self.flush([(make_contract(), message) for message in messages])
+
+        self.assertEqual(Contract.objects.count(), 2)
+        self.assertTrue(all(message.acked for message in messages))
+        self.assertFalse(any(message.rejected for message in messages))
+
+    def test_fallback_saves_one_by_one(self):
+        committed = make_contract()
+        committed.save()
+        committed_msg, invalid_msg, valid_msg = StubMessage(), StubMessage(), StubMessage()
+
+        with broken_cache():
+            self.flush([
+                (committed, committed_msg),
+                (make_contract(end_date=None), invalid_msg),
+                (make_contract(client_name="valid"), valid_msg),
+            ])
+
+        # The committed contract is acked without a second insert, the invalid one is
+        # dead-lettered and the valid one is saved.
+        self.assertEqual(Contract.objects.count(), 2)
+        self.assertTrue(Contract.objects.filter(client_name="valid").exists())
+        self.assertTrue(committed_msg.acked)
+        self.assertTrue(invalid_msg.rejected)
+        self.assertFalse(invalid_msg.acked)
+        self.assertTrue(valid_msg.acked)
+
+
+class RetryOrRejectTests(TransactionTestCase):
+
+    def run_retry(self, message, error):
+        channel = StubChannel()
+        with mock.patch("contracts.consumer.asyncio.sleep", new=mock.AsyncMock()):
+            asyncio.run(retry_or_reject(channel, message, error))
+        return channel.default_exchange.published
+
+    def test_transient_error_is_republished_with_retry_count(self):
+        message = StubMessage()
+        published = self.run_retry(message, OperationalError("db gone"))
+
+        self.assertEqual(len(published), 1)
+        republished, routing_key = published[0]
+        self.assertEqual(routing_key, "generate_contract")
+        self.assertEqual(republished.headers["x-retry-count"], 1)
+        self.assertTrue(message.acked)
+        self.assertFalse(message.rejected)
+
+    def test_permanent_error_is_dead_lettered(self):
+        message = StubMessage()
+        published = self.run_retry(message, ValueError("bad payload"))
+
+        self.assertEqual(published, [])
+        self.assertTrue(message.rejected)
+        self.assertFalse(message.requeued)
+
+    def test_exhausted_retries_are_dead_lettered(self):
+        message = StubMessage(headers={"x-retry-count": MAX_RETRIES})
+        published = self.run_retry(message, OperationalError("db gone"))
+
+        self.assertEqual(published, [])
+        self.assertTrue(message.rejected)
+
+
+class ContractCacheTests(TransactionTestCase):
+
+    def test_invalidate_changes_version(self):
+        version = contract_cache.contract_cache_version()
+        contract_cache.invalidate_contract_cache()
+        self.assertNotEqual(contract_cache.contract_cache_version(), version)
+
+    def test_cache_errors_are_swallowed(self):
+        with mock.patch.object(contract_cache.cache, "get_or_set", side_effect=ConnectionError("cache down")):
+            self.assertIsNone(contract_cache.contract_cache_version())
+        with broken_cache():
+            contract_cache.invalidate_contract_cache()
+
+    def test_contract_list_is_invalidated_on_create(self):
+        self.client.post(
+            "/contracts/contracts/",
+            {"client_name": "c", "owner_name": "o", "start_date": "2025-01-01",
+             "end_date": "2025-01-05", "total_value": 1},
+            content_type="application/json",
+        )
+        self.assertEqual(len(self.client.get("/contracts/contracts/").json()["results"]), 1)
+
+        self.client.post(
+            "/contracts/contracts/",
+            {"client_name": "c2", "owner_name": "o", "start_date": "2025-01-01",
+             "end_date": "2025-01-05", "total_value": 1},
+            content_type="application/json",
+        )
+        self.assertEqual(len(self.client.get("/contracts/contracts/").json()["results"]), 2)
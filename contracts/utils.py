@@ -2,16 +2,19 @@ from Crypto.PublicKey import RSA
 from Crypto.Signature import pkcs1_15
 from Crypto.Hash import SHA256
 
-# Generate a key pair
-def generate_keys():
+# Generate a key pair (the private key is encrypted when a passphrase is given)
+def generate_keys(passphrase=None):
     key = RSA.generate(2048)
-    private_key = key.export_key()
+    if passphrase:
+        private_key = key.export_key(passphrase=passphrase, pkcs=8, protection="scryptAndAES128-CBC")
+    else:
+        private_key = key.export_key()
     public_key = key.publickey().export_key()
     return private_key, public_key
 
 # Sign a message
-def sign_message(message: str, private_key_bytes: bytes):
-    key = RSA.import_key(private_key_bytes)
+def sign_message(message: str, private_key_bytes: bytes, passphrase=None):
+    key = RSA.import_key(private_key_bytes, passphrase)
     h = SHA256.new(message.encode('utf-8'))
     signature = pkcs1_15.new(key).sign(h)
     return signature.hex()
@@ -2,128 +2,21 @@ from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework import status, viewsets
+from rest_framework.pagination import CursorPagination
 from django.utils.timezone import now
 from django.conf import settings
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.vary import vary_on_headers
 import base64
 import os
-import json
-import threading
-import logging
-import pika
-import requests
+import functools
 
 from .utils import generate_keys, sign_message
-from .models import Contract
-from .serialiazars import ContractSerializer
-from .gemini_helper import GeminiHelper
-
-# ----------- Logging -----------
-logger = logging.getLogger("rabbitmq_consumer")
-logger.setLevel(logging.DEBUG)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
-
-# ----------- RabbitMQ Setup -----------
-
-def get_rabbitmq_channel():
-    try:
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=os.environ.get('RABBITMQ_HOST', 'host.docker.internal'),
-                port=int(os.environ.get('RABBITMQ_PORT', 5672)),
-                heartbeat=int(os.environ.get('RABBITMQ_HEARTBEAT', 600)),
-                blocked_connection_timeout=int(os.environ.get('RABBITMQ_TIMEOUT', 300))
-            )
-        )
-        channel = connection.channel()
-        channel.queue_declare(queue='generate_contract', durable=True)
-        logger.info("Connected to RabbitMQ and declared queue 'generate_contract'")
-        return connection, channel
-    except Exception as e:
-        logger.error(f"Failed to connect to RabbitMQ: {e}")
-        raise
-
-# ----------- External API Calls -----------
-
-def fetch_profile(user):
-    try:
-        url = f"http://host.docker.internal:8008/profile/profil/?user={user}"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        logger.error(f"Failed to fetch profile for user {user}: {e}")
-        return None
-
-def fetch_equipment(equipment_id):
-    try:
-        url = f"http://host.docker.internal:8006/api/stuffs/{equipment_id}/"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        logger.error(f"Failed to fetch equipment ID {equipment_id}: {e}")
-        return None
-
-# ----------- RabbitMQ Consumer Thread -----------
-
-def rabbitmq_consumer():
-    try:
-        connection, channel = get_rabbitmq_channel()
-
-        def callback(ch, method, properties, body):
-            try:
-                data = json.loads(body)
-                logger.info(f"Received message: {data}")
-
-                owner_name = data.get("rental")
-                client_name = data.get("client")
-                equipment_id = data.get("equipment")
-
-                profile_info_client = fetch_profile(client_name)
-                profile_info_owner = fetch_profile(owner_name)
-                equipment_info = (
-                    [fetch_equipment(eid) for eid in equipment_id]
-                    if isinstance(equipment_id, list)
-                    else fetch_equipment(equipment_id)
-                )
-
-                contract_data = {
-                    "owner_name": owner_name,
-                    "client_name": client_name,
-                    "equipment": equipment_id,
-                    "start_date": data.get("start_date"),
-                    "end_date": data.get("end_date"),
-                    "total_value": data.get("total_price"),
-                    "details": data.get("status", ""),
-                }
-
-                helper = GeminiHelper()
-                contract = helper.create_draft_contract(contract_data, profile_info_client, profile_info_owner, equipment_info)
-
-                logger.info(f"Contract created with ID: {contract.id}")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-            except Exception as e:
-                logger.error(f"Error processing message: {e}", exc_info=True)
-
-        channel.basic_qos(prefetch_count=1)
-        channel.basic_consume(queue='generate_contract', on_message_callback=callback)
-        logger.info("Waiting for messages on 'generate_contract'. To exit press CTRL+C")
-        channel.start_consuming()
-
-    except Exception as e:
-        logger.error(f"Fatal error in RabbitMQ consumer: {e}", exc_info=True)
-    finally:
-        if 'connection' in locals() and connection.is_open:
-            connection.close()
-            logger.info("RabbitMQ connection closed.")
-
-# Start consumer thread
-consumer_thread = threading.Thread(target=rabbitmq_consumer, daemon=True)
-consumer_thread.start()
+from .models import Contract, OwnerKey
+from .serialiazars import ContractListSerializer, ContractSerializer
+from .cache import CONTRACT_CACHE_TIMEOUT, contract_cache_version, invalidate_contract_cache
 
 # ----------- Signature API -----------
 
@@ -133,22 +26,27 @@ def sign_contract(request):
     try:
         owner_name = request.data.get("owner_name")
         client_name = request.data.get("client_name")
-        contract_text = request.data.get("contract_text")
         signature_image_data = request.data.get("signature_image")
 
-        if not all([owner_name, client_name, contract_text, signature_image_data]):
+        if not all([owner_name, client_name, signature_image_data]):
             return Response({"error": "Missing required fields"}, status=status.HTTP_400_BAD_REQUEST)
 
-        contract = get_contract_or_404(owner_name, client_name)
-        signature_image_path = save_signature_image(owner_name, signature_image_data)
+        # Lock the row so concurrent signatures of the same contract are serialized.
+        with transaction.atomic():
+            contract = get_contract_or_404(owner_name, client_name, select_for_update=True)
+            # Only the stored contract is ever signed with the owner's key, never client-supplied text.
+            contract_text = contract.contract_text
+            if not contract_text:
+                raise ValueError("Contract has no text to sign")
+            signature_image_path = save_signature_image(owner_name, signature_image_data)
 
-        private_key, public_key = generate_keys()
-        signature = sign_message(contract_text, private_key)
+            contract.signed_date = now().date()
+            contract.status = 'signed'
+            contract.save(update_fields=["signed_date", "status"])
+            transaction.on_commit(invalidate_contract_cache)
 
-        contract.signed_date = now().date()
-        contract.status = 'signed'
-        contract.document.name = signature_image_path
-        contract.save()
+        private_key, public_key = get_owner_keys(owner_name)
+        signature = sign_message(contract_text, private_key, settings.SIGNING_KEY_PASSPHRASE)
 
         return Response({
             "message": contract_text,
@@ -170,14 +68,62 @@ def sign_contract(request):
 
 # ----------- Contract ViewSet -----------
 
+def cache_contract_response(view_func):
+    """ cache_page whose key prefix follows the current contract cache version. """
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        version = contract_cache_version()
+        if version is None:
+            return view_func(request, *args, **kwargs)
+        key_prefix = f"contracts.{version}"
+        return cache_page(CONTRACT_CACHE_TIMEOUT, key_prefix=key_prefix)(view_func)(request, *args, **kwargs)
+    return wrapper
+
+class ContractCursorPagination(CursorPagination):
+    page_size = 50
+    ordering = '-id'
+
 class ContractViewSet(viewsets.ModelViewSet):
     queryset = Contract.objects.all()
     serializer_class = ContractSerializer
+    pagination_class = ContractCursorPagination
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action == 'list':
+            # Skip the (large) generated contract_text for list responses.
+            queryset = queryset.only(*ContractListSerializer.Meta.fields)
         return self.filter_queryset_by_params(queryset)
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ContractListSerializer
+        return super().get_serializer_class()
+
+    @method_decorator(cache_contract_response)
+    @method_decorator(cache_control(public=True, max_age=CONTRACT_CACHE_TIMEOUT, s_maxage=120))
+    @method_decorator(vary_on_headers("Authorization", "Accept"))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(cache_contract_response)
+    @method_decorator(cache_control(public=True, max_age=CONTRACT_CACHE_TIMEOUT, s_maxage=120))
+    @method_decorator(vary_on_headers("Authorization", "Accept"))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_contract_cache()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_contract_cache()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_contract_cache()
+
     def filter_queryset_by_params(self, queryset):
         owner_name = self.request.query_params.get('owner_name')
         client_name = self.request.query_params.get('client_name')
@@ -191,25 +137,51 @@ class ContractViewSet(viewsets.ModelViewSet):
 
 # ----------- Utility Functions -----------
 
+SIGNATURE_DIR = os.path.join(settings.MEDIA_ROOT, "signatures")
+# Created on the first save rather than at import, so migrate/check/the consumer don't create it.
+_signature_dir_ready = False
+
 def save_signature_image(owner_name: str, signature_image_data: str) -> str:
     try:
         header, encoded = signature_image_data.split(",", 1)
-        image_data = base64.b64decode(encoded)
+        image_data = base64.b64decode(encoded, validate=False)
     except (ValueError, IndexError):
         raise ValueError("Invalid base64 image data")
 
     image_name = f"{owner_name.replace(' ', '_')}_{now().strftime('%Y%m%d%H%M%S')}.png"
-    image_dir = os.path.join(settings.MEDIA_ROOT, "signatures")
-    os.makedirs(image_dir, exist_ok=True)
-
-    image_path = os.path.join(image_dir, image_name)
-    with open(image_path, "wb") as f:
-        f.write(image_data)
+    global _signature_dir_ready
+    if not _signature_dir_ready:
+        os.makedirs(SIGNATURE_DIR, exist_ok=True)
+        _signature_dir_ready = True
+    image_path = os.path.join(SIGNATURE_DIR, image_name)
+
+    # Write the decoded bytes straight to the fd, bypassing Python's buffered IO.
+    fd = os.open(image_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(image_data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
 
     return os.path.join('signatures', image_name)
 
-def get_contract_or_404(owner_name: str, client_name: str) -> Contract:
+def get_contract_or_404(owner_name: str, client_name: str, select_for_update: bool = False) -> Contract:
+    queryset = Contract.objects.all()
+    if select_for_update:
+        queryset = queryset.select_for_update()
     try:
-        return Contract.objects.get(owner_name=owner_name, client_name=client_name)
+        return queryset.get(owner_name=owner_name, client_name=client_name)
     except Contract.DoesNotExist:
         raise ValueError("Contract not found")
+
+def get_owner_keys(owner_name: str):
+    """ Return the owner's stored key pair, generating it only on the first signature. """
+    owner_key = OwnerKey.objects.filter(owner_name=owner_name).first()
+    if owner_key is None:
+        private_key, public_key = generate_keys(settings.SIGNING_KEY_PASSPHRASE)
+        owner_key, _ = OwnerKey.objects.get_or_create(
+            owner_name=owner_name,
+            defaults={"private_key": private_key.decode(), "public_key": public_key.decode()},
+        )
+    return owner_key.private_key.encode(), owner_key.public_key.encode()